@@ -1,16 +1,26 @@
 import os
+import hashlib
+import io
+import re
 import asyncio
 import logging
 import json
+import csv
 import time
-from typing import Optional, Any
+import queue
+import signal
+import threading
+from concurrent.futures import Future
+from typing import Optional, Any, Callable, Iterator
 from pathlib import Path
 from dotenv import load_dotenv
+from cachetools import TTLCache
 import snowflake.connector
+import snowflake.connector.cursor
 from mcp.server import Server
 from mcp.server import stdio
 from mcp.types import Tool, ServerResult, TextContent
-from contextlib import closing
+from contextlib import closing, contextmanager
 
 # Load environment variables from .env file
 env_path = Path(__file__).parent / '.env'
@@ -32,6 +42,104 @@ logging.getLogger('urllib3').setLevel(logging.WARNING)
 
 logger = logging.getLogger('snowflake_server')
 
+# Whitespace, comments and empty statements in front of the first SQL token
+_LEADING_RE = re.compile(r'(?:\s+|--[^\n]*|//[^\n]*|/\*.*?\*/|;)*', re.DOTALL)
+# Leading SQL verb, matched without copying or upper-casing the whole query
+_VERB_RE = re.compile(r'[A-Za-z]+')
+# Statements that only read data, anything else is treated as a write
+_READ_VERBS = frozenset({'SELECT', 'WITH', 'SHOW', 'DESC', 'DESCRIBE', 'EXPLAIN'})
+# Statements whose result is reported as an affected row count
+_WRITE_VERBS = frozenset({'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'DROP', 'ALTER', 'MERGE', 'TRUNCATE'})
+
+# Statements that change session or transaction state, which pooled connections do not share
+_SESSION_RE = re.compile(
+    r'(?:USE|BEGIN|START|COMMIT|ROLLBACK|SET|UNSET)\b'
+    r'|ALTER\s+SESSION\b'
+    r'|CREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:LOCAL|GLOBAL)\s+)?(?:TEMP|TEMPORARY|VOLATILE)\b',
+    re.IGNORECASE)
+
+# Functions whose result changes between executions or depends on the session, queries
+# using them are never cached. Date and context keywords may be written without parentheses.
+_VOLATILE_RE = re.compile(
+    r'\b(?:current_timestamp|current_time|current_date|localtime|localtimestamp'
+    r'|current_user|current_role|current_database|current_schema|current_warehouse|current_account)\b'
+    r'|\b(?:sysdate|getdate|systimestamp|random|uuid_string|current_session|current_transaction'
+    r'|seq[1248])\s*\('
+    r'|\.nextval\b',
+    re.IGNORECASE
+)
+
+# Read query result cache settings
+_CACHE_MAX_CHARS = 64 * 1024 * 1024  # total size of cached results
+_CACHE_TTL = 300  # seconds
+
+# Seconds to wait for a free pooled connection
+_POOL_TIMEOUT = 120
+
+_EXECUTE_QUERY_TOOL = Tool(
+    name="execute_query",
+    description="Execute a SQL query on Snowflake",
+    inputSchema={
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "SQL query to execute"
+            }
+        },
+        "required": ["query"]
+    }
+)
+
+_EXECUTE_BATCH_TOOL = Tool(
+    name="execute_batch",
+    description="Execute several SQL statements on Snowflake in one round-trip, inside a single transaction "
+                "(DDL statements commit implicitly and are not rolled back)",
+    inputSchema={
+        "type": "object",
+        "properties": {
+            "queries": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "SQL statements to execute in order"
+            },
+            "params": {
+                "type": "array",
+                "items": {"type": "array"},
+                "description": "Optional parameter rows, runs the single query once per row with executemany"
+            }
+        },
+        "required": ["queries"]
+    }
+)
+
+_TOOLS = [_EXECUTE_QUERY_TOOL, _EXECUTE_BATCH_TOOL]
+
+def _query_verb(query: str) -> str:
+    """
+    Return the upper-cased first SQL keyword of the query, ignoring leading comments
+    """
+    m = _VERB_RE.match(query, _LEADING_RE.match(query).end())
+    return m.group(0).upper() if m else ""
+
+def _is_empty_query(query: str) -> bool:
+    """
+    Check whether nothing but whitespace, comments and semicolons is left of the query
+    """
+    return _LEADING_RE.match(query).end() == len(query)
+
+def _is_session_query(query: str) -> bool:
+    """
+    Check whether the query changes session or transaction state, ignoring leading comments
+    """
+    return _SESSION_RE.match(query, _LEADING_RE.match(query).end()) is not None
+
+def _cache_key(query: str) -> str:
+    """
+    Hash the SQL text for use as a cache key
+    """
+    return hashlib.blake2b(query.strip().encode(), digest_size=16).hexdigest()
+
 class SnowflakeConnection:
     """
     Snowflake database connection management class
@@ -58,88 +166,136 @@ class SnowflakeConnection:
                 raise ValueError(f"Missing required environment variable: {env_var}")
             self.config[config_key] = value
             
-        self.conn: Optional[snowflake.connector.SnowflakeConnection] = None
-        
-        # Check available warehouses
-        self.list_available_warehouses()
+        # Result download tuning
+        self.prefetch_threads = int(os.getenv("MCP_SF_PREFETCH_THREADS", "8"))
+        self.arraysize = int(os.getenv("MCP_SF_ARRAYSIZE", "10000"))
+
+        # Response size limits
+        self.max_rows = int(os.getenv("MCP_SF_MAX_ROWS", "10000"))
+        self.max_chars = int(os.getenv("MCP_SF_MAX_CHARS", "4000000"))
 
-    def list_available_warehouses(self):
+        # Connection pool, each pooled connection keeps one reusable cursor.
+        # Free slots are None and are filled with a new connection on first use.
+        self.pool_size = int(os.getenv("MCP_SF_POOL_SIZE", "4"))
+        self._pool: queue.LifoQueue = queue.LifoQueue()
+        for _ in range(self.pool_size):
+            self._pool.put(None)
+        # Every open connection, idle or in use, so shutdown can close all of them
+        self._connections: set[snowflake.connector.SnowflakeConnection] = set()
+        self._connections_lock = threading.Lock()
+        # Set by close(), no connection is opened or handed out afterwards
+        self._closed = False
+        # Rendered results of read queries, keyed by a hash of the SQL text and sized by length
+        self._cache: TTLCache = TTLCache(maxsize=_CACHE_MAX_CHARS, ttl=_CACHE_TTL, getsizeof=len)
+        self._cache_lock = threading.Lock()
+        # Incremented by every write, reads only cache results if it did not change while they ran
+        self._generation = 0
+        # Futures of read queries currently executing, keyed like the cache
+        self._pending: dict[str, Future] = {}
+
+    def _connect(self) -> snowflake.connector.SnowflakeConnection:
         """
-        List all warehouses available to the current user
+        Create a new database connection
         """
+        logger.info("Creating new connection...")
         try:
-            # Use main connection with proper warehouse and role
-            conn = self.ensure_connection()
-            if not conn:
-                raise Exception("Failed to establish connection")
-                
-            cursor = conn.cursor()
-            cursor.execute("SHOW WAREHOUSES")
-            warehouses = cursor.fetchall()
-            logger.info("Available warehouses:")
-            for warehouse in warehouses:
-                logger.info(f"Name: {warehouse[0]}, Size: {warehouse[1]}, State: {warehouse[3]}")
-            cursor.close()
+            # Warehouse, database, schema and role are set server-side during login
+            conn = snowflake.connector.connect(
+                **self.config,
+                # Single-statement writes rely on it, session statements that could turn it off
+                # are rejected by execute_query and close their connection in execute_batch
+                autocommit=True,
+                session_parameters={
+                    'TIMEZONE': 'UTC',
+                    'CLIENT_PREFETCH_THREADS': self.prefetch_threads,
+                    'CLIENT_RESULT_CHUNK_SIZE': 160
+                },
+                network_timeout=15,
+                login_timeout=15
+            )
         except Exception as e:
-            logger.error(f"Error listing warehouses: {str(e)}")
+            logger.error("Connection error: %s", e)
             raise
+        logger.info("Connected - configured Database: %s, Schema: %s, Warehouse: %s, Role: %s",
+                    self.config['database'], self.config['schema'], self.config['warehouse'], self.config['role'])
+        return conn
 
-    def ensure_connection(self) -> snowflake.connector.SnowflakeConnection:
+    def _checkout(self) -> snowflake.connector.cursor.SnowflakeCursor:
         """
-        Ensure database connection is available, create new connection if it doesn't exist or is disconnected
+        Take a cursor from the pool, opening a new connection for a free or closed slot
         """
         try:
-            if not self.conn:
-                logger.info("Creating new connection...")
-                
-                # Create initial connection without warehouse
-                self.conn = snowflake.connector.connect(
-                    user=self.config["user"],
-                    password=self.config["password"],
-                    account=self.config["account"],
-                    database=self.config["database"],
-                    schema=self.config["schema"],
-                    role=self.config["role"],
-                    network_timeout=15,
-                    login_timeout=15
-                )
-                
-                # First, list available warehouses
-                with self.conn.cursor() as cursor:
-                    cursor.execute("SHOW WAREHOUSES")
-                    warehouses = cursor.fetchall()
-                    logger.info("Available warehouses:")
-                    available_warehouses = []
-                    for warehouse in warehouses:
-                        warehouse_name = warehouse[0]
-                        available_warehouses.append(warehouse_name)
-                        logger.info(f"Found warehouse: {warehouse_name}")
-                    
-                    # Check if our configured warehouse exists
-                    desired_warehouse = self.config['warehouse']
-                    if desired_warehouse in available_warehouses:
-                        cursor.execute(f"USE WAREHOUSE {desired_warehouse}")
-                        logger.info(f"Successfully set warehouse to {desired_warehouse}")
-                    else:
-                        available_wh_list = ", ".join(available_warehouses)
-                        raise Exception(f"Configured warehouse {desired_warehouse} not found. Available warehouses: {available_wh_list}")
-                    
-                    # Verify connection context
-                    cursor.execute("SELECT CURRENT_DATABASE(), CURRENT_SCHEMA(), CURRENT_WAREHOUSE(), CURRENT_ROLE()")
-                    context = cursor.fetchone()
-                    if context:
-                        logger.info(f"Connected successfully - Database: {context[0]}, Schema: {context[1]}, Warehouse: {context[2]}, Role: {context[3]}")
-            
-            return self.conn
-            
+            cursor = self._pool.get(timeout=_POOL_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError(f"No Snowflake connection available after {_POOL_TIMEOUT}s")
+        if self._closed:
+            # Pass the slot on so the next waiter wakes up and fails too
+            self._pool.put(cursor)
+            raise RuntimeError("Snowflake connection pool is closed")
+
+        # Local check only, avoids a round-trip to verify the session
+        if cursor is not None:
+            if not cursor.is_closed():
+                return cursor
+            with self._connections_lock:
+                self._connections.discard(cursor.connection)
+        try:
+            conn = self._connect()
+        except Exception:
+            self._pool.put(None)
+            raise
+        with self._connections_lock:
+            closed = self._closed
+            if not closed:
+                self._connections.add(conn)
+        if closed:
+            # close() ran while the connection was being opened
+            self._discard_connection(conn)
+            raise RuntimeError("Snowflake connection pool is closed")
+        cursor = conn.cursor()
+        cursor.arraysize = self.arraysize
+        return cursor
+
+    def _discard(self, cursor: snowflake.connector.cursor.SnowflakeCursor):
+        """
+        Close an unusable connection and free its pool slot
+        """
+        self._discard_connection(cursor.connection)
+
+    def _discard_connection(self, conn: snowflake.connector.SnowflakeConnection):
+        """
+        Close a connection and free its pool slot
+        """
+        with self._connections_lock:
+            self._connections.discard(conn)
+        try:
+            conn.close()
         except Exception as e:
-            logger.error(f"Connection error: {str(e)}")
-            if self.conn:
-                self.conn.close()
-                self.conn = None
+            logger.error("Error closing connection: %s", e)
+        finally:
+            self._pool.put(None)
+
+    @contextmanager
+    def _acquire(self) -> Iterator[snowflake.connector.cursor.SnowflakeCursor]:
+        """
+        Borrow a pooled cursor, returning it to the pool when done
+        """
+        cursor = self._checkout()
+        broken = False
+        try:
+            yield cursor
+        except (snowflake.connector.errors.InterfaceError,
+                snowflake.connector.errors.OperationalError):
+            broken = True
             raise
+        finally:
+            # Connections returned after close() are closed instead of pooled
+            if broken or self._closed:
+                self._discard(cursor)
+            else:
+                self._pool.put(cursor)
 
-    def execute_query(self, query: str) -> list[dict[str, Any]]:
+    def execute_query(self, query: str) -> str:
         """
         Execute SQL query and return results
         
@@ -147,57 +303,271 @@ class SnowflakeConnection:
             query (str): SQL query statement
             
         Returns:
-            list[dict[str, Any]]: List of query results
+            str: Query results rendered as CSV with a header row
         """
+        # Nothing to send to the server
+        if _is_empty_query(query):
+            return "warning\r\nempty query\r\n"
+
         start_time = time.time()
-        logger.info(f"Executing query: {query[:200]}...")  #  Log only first 200 characters
+        logger.info("Executing query: %s...", query[:200])  #  Log only first 200 characters
         
+        if _is_session_query(query):
+            # The next query may run on another pooled connection that never saw the change
+            raise ValueError("Session and transaction statements are not supported by execute_query, "
+                             "use execute_batch to run them together with the statements that depend on them")
+
+        verb = _query_verb(query)
+        is_read = verb in _READ_VERBS
+        cacheable = is_read and not _VOLATILE_RE.search(query)
+        key = _cache_key(query) if cacheable else None
+        generation = None
+        future: Optional[Future] = None
+        if cacheable:
+            with self._cache_lock:
+                generation = self._generation
+                cached = self._cache.get(key)
+                pending = self._pending.get(key) if cached is None else None
+                if cached is None and pending is None:
+                    # First caller runs the query, identical concurrent callers wait on its future
+                    future = self._pending[key] = Future()
+            if cached is not None:
+                logger.info("Returning cached result")
+                return cached
+            if pending is not None:
+                logger.info("Waiting for identical in-flight query")
+                return pending.result()
+
         try:
-            conn = self.ensure_connection()
-            with conn.cursor() as cursor:
-                # Use transaction for write operations
-                if any(query.strip().upper().startswith(word) for word in ['INSERT', 'UPDATE', 'DELETE', 'CREATE', 'DROP', 'ALTER']):
-                    cursor.execute("BEGIN")
-                    try:
-                        cursor.execute(query)
-                        conn.commit()
-                        logger.info(f"Write query executed in {time.time() - start_time:.2f}s")
-                        return [{"affected_rows": cursor.rowcount}]
-                    except Exception as e:
-                        conn.rollback()
-                        raise
-                else:
-                    # Read operations
-                    cursor.execute(query)
-                    if cursor.description:
-                        columns = [col[0] for col in cursor.description]
-                        rows = cursor.fetchall()
-                        results = [dict(zip(columns, row)) for row in rows]
-                        logger.info(f"Read query returned {len(results)} rows in {time.time() - start_time:.2f}s")
-                        return results
-                    return []
-                
+            result, complete = self._execute_with_retry(query, verb, start_time)
         except snowflake.connector.errors.ProgrammingError as e:
-            logger.error(f"SQL Error: {str(e)}")
-            logger.error(f"Error Code: {getattr(e, 'errno', 'unknown')}")
+            logger.error("SQL Error: %s", e)
+            logger.error("Error Code: %s", getattr(e, 'errno', 'unknown'))
+            self._resolve_pending(key, future, error=e)
             raise
         except Exception as e:
-            logger.error(f"Query error: {str(e)}")
-            logger.error(f"Error type: {type(e).__name__}")
+            logger.error("Query error: %s", e)
+            logger.error("Error type: %s", type(e).__name__)
+            self._resolve_pending(key, future, error=e)
             raise
+        finally:
+            if not is_read:
+                # Anything but a plain read may change data or session context, even when it
+                # failed after reaching the server
+                self._invalidate()
+
+        if cacheable:
+            with self._cache_lock:
+                # Skip truncated results and results that a write finishing while the read ran
+                # may have made stale
+                if complete and generation == self._generation and len(result) <= self._cache.maxsize:
+                    self._cache[key] = result
+        self._resolve_pending(key, future, result=result)
+        return result
+
+    def _invalidate(self):
+        """
+        Drop cached results after a statement that may have changed data
+        """
+        with self._cache_lock:
+            # Reads that started before this point must not store their results
+            self._generation += 1
+            self._cache.clear()
+            # Later identical reads run anew instead of joining a read that started before the write
+            self._pending.clear()
+
+    def _resolve_pending(self, key: Optional[str], future: Optional[Future],
+                         result: Optional[str] = None, error: Optional[BaseException] = None):
+        """
+        Hand the outcome of an in-flight query to any waiting callers
+        """
+        if future is None:
+            return
+        with self._cache_lock:
+            # A write may already have replaced the entry for this key
+            if self._pending.get(key) is future:
+                del self._pending[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _execute_with_retry(self, query: str, verb: str, start_time: float) -> tuple[str, bool]:
+        """
+        Execute SQL query, retrying reads once on a fresh connection if the current one is unusable
+        """
+        try:
+            with self._acquire() as cursor:
+                return self._run_query(cursor, query, verb, start_time)
+        except (snowflake.connector.errors.InterfaceError,
+                snowflake.connector.errors.OperationalError) as e:
+            if verb not in _READ_VERBS:
+                # The write may have been committed before the response was lost,
+                # running it again could apply it twice
+                raise
+            # Connection was dropped from the pool, retry once on another one
+            logger.warning("Connection error, reconnecting and retrying: %s", e)
+            with self._acquire() as cursor:
+                return self._run_query(cursor, query, verb, start_time)
+
+    def _run_query(self, cursor: snowflake.connector.cursor.SnowflakeCursor, query: str, verb: str, start_time: float) -> tuple[str, bool]:
+        """
+        Execute SQL query on a pooled cursor, returning the rendered result and whether it is complete
+        """
+        if verb in _WRITE_VERBS:
+            # Single statements are committed by autocommit, no explicit transaction needed
+            cursor.execute(query)
+            logger.info("Write query executed in %.2fs", time.time() - start_time)
+            return f"affected_rows\r\n{cursor.rowcount}\r\n", True
+        else:
+            # Reads and other statements that may return a result set
+            cursor.execute(query)
+            if cursor.description:
+                columns = [col[0] for col in cursor.description]
+                total_rows = cursor.rowcount
+                row_count = 0
+                truncated = False
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(columns)
+                # One row past the limit tells whether anything was left out
+                for rows in self._iter_row_batches(cursor, self.max_rows + 1):
+                    for row in rows:
+                        # Stop once the response is large enough, the rest stays on the server
+                        if row_count >= self.max_rows or buf.tell() >= self.max_chars:
+                            truncated = True
+                            break
+                        writer.writerow(row)
+                        row_count += 1
+                    if truncated:
+                        break
+                if truncated:
+                    total = total_rows if total_rows is not None and total_rows >= 0 else "?"
+                    buf.write(f"-- truncated: {row_count} of ~{total} rows --\r\n")
+                logger.info("Read query returned %d rows in %.2fs", row_count, time.time() - start_time)
+                return buf.getvalue(), not truncated
+            return "", True
+
+    def _iter_row_batches(self, cursor: snowflake.connector.cursor.SnowflakeCursor, limit: int) -> Iterator[list[tuple]]:
+        """
+        Yield at most limit result rows in batches, streaming Arrow batches when the result set supports it
+        """
+        try:
+            batches = cursor.fetch_arrow_batches()
+        except (snowflake.connector.errors.NotSupportedError,
+                snowflake.connector.errors.ProgrammingError):
+            # Result is not in Arrow format or pyarrow is not installed
+            batches = None
+
+        remaining = limit
+        if batches is not None:
+            for batch in batches:
+                if remaining <= 0:
+                    return
+                # Only convert the rows that can still be rendered
+                batch = batch.slice(0, remaining)
+                remaining -= batch.num_rows
+                yield list(zip(*(column.to_pylist() for column in batch.columns)))
+            return
+
+        while remaining > 0 and (rows := cursor.fetchmany(min(cursor.arraysize, remaining))):
+            remaining -= len(rows)
+            yield rows
+
+    def execute_batch(self, queries: list[str], params: Optional[list[list[Any]]] = None) -> str:
+        """
+        Execute several SQL statements in a single round-trip
+        
+        Args:
+            queries (list[str]): SQL statements, run in order inside one transaction
+            params (Optional[list[list[Any]]]): Parameter rows for executemany,
+                requires exactly one statement with %s placeholders
+            
+        Returns:
+            str: Affected row count per statement rendered as CSV with a header row
+        """
+        start_time = time.time()
+        if not isinstance(queries, list) or not queries:
+            raise ValueError("queries must be a non-empty list of SQL statements")
+        if not all(isinstance(q, str) and not _is_empty_query(q) for q in queries):
+            raise ValueError("queries must only contain non-empty SQL statements")
+        if params is not None:
+            if len(queries) != 1:
+                raise ValueError("params requires exactly one query")
+            if not isinstance(params, list) or not all(isinstance(row, list) for row in params):
+                raise ValueError("params must be a list of parameter rows")
+        logger.info("Executing batch of %d statement(s)", len(queries))
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(("statement", "affected_rows"))
+        try:
+            with self._acquire() as cursor:
+                conn = cursor.connection
+                try:
+                    if params is not None:
+                        cursor.execute("BEGIN")
+                        cursor.executemany(queries[0], params)
+                        writer.writerow((1, cursor.rowcount))
+                        conn.commit()
+                    else:
+                        # Multi-statement request, wrapped in a transaction executed in the same round-trip.
+                        # Separators go on their own line so a trailing -- comment cannot swallow them.
+                        statements = ["BEGIN", *(q.strip().rstrip(";") for q in queries), "COMMIT"]
+                        cursor.execute("\n;\n".join(statements), num_statements=len(statements))
+                        for index in range(1, len(queries) + 1):
+                            cursor.nextset()
+                            writer.writerow((index, cursor.rowcount))
+                        cursor.nextset()
+                except Exception:
+                    self._rollback(conn)
+                    raise
+                finally:
+                    if any(_is_session_query(q) for q in queries):
+                        # Closed connections are reopened on checkout, so the changed
+                        # session state does not leak into later queries
+                        conn.close()
+        except Exception as e:
+            logger.error("Batch error: %s", e)
+            raise
+        finally:
+            # Any statement in the batch may have changed cached data, even if a later one failed
+            self._invalidate()
+
+        logger.info("Batch executed in %.2fs", time.time() - start_time)
+        return buf.getvalue()
+
+    def _rollback(self, conn: snowflake.connector.SnowflakeConnection):
+        """
+        Roll back the open transaction, logging a failure instead of hiding the original error
+        """
+        try:
+            conn.rollback()
+        except Exception as e:
+            logger.error("Rollback failed: %s", e)
+
+    async def aclose(self):
+        """
+        Close all connections without blocking the event loop
+        """
+        await asyncio.to_thread(self.close)
 
     def close(self):
         """
-        Close database connection
+        Close all connections opened by the pool, including ones still in use by a query
         """
-        if self.conn:
+        with self._connections_lock:
+            self._closed = True
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
             try:
-                self.conn.close()
+                conn.close()
                 logger.info("Connection closed")
             except Exception as e:
-                logger.error(f"Error closing connection: {str(e)}")
-            finally:
-                self.conn = None
+                logger.error("Error closing connection: %s", e)
+        # Wake callers waiting for a connection, they fail instead of reconnecting
+        self._pool.put(None)
 
 class SnowflakeServer(Server):
     """
@@ -208,27 +578,18 @@ class SnowflakeServer(Server):
         self.db = SnowflakeConnection()
         logger.info("SnowflakeServer initialized")
 
+        # Tool name -> handler, looked up once per call
+        self._dispatch = {
+            "execute_query": self._do_execute_query,
+            "execute_batch": self._do_execute_batch,
+        }
+
         @self.list_tools()
         async def handle_tools():
             """
             Return list of available tools
             """
-            return [
-                Tool(
-                    name="execute_query",
-                    description="Execute a SQL query on Snowflake",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": "SQL query to execute"
-                            }
-                        },
-                        "required": ["query"]
-                    }
-                )
-            ]
+            return _TOOLS
 
         @self.call_tool()
         async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
@@ -242,43 +603,65 @@ class SnowflakeServer(Server):
             Returns:
                 list[TextContent]: Execution results
             """
-            if name == "execute_query":
-                start_time = time.time()
-                try:
-                    result = self.db.execute_query(arguments["query"])
-                    execution_time = time.time() - start_time
-                    
-                    return [TextContent(
-                        type="text",
-                        text=f"Results (execution time: {execution_time:.2f}s):\n{result}"
-                    )]
-                except Exception as e:
-                    error_message = f"Error executing query: {str(e)}"
-                    logger.error(error_message)
-                    return [TextContent(
-                        type="text",
-                        text=error_message
-                    )]
+            handler = self._dispatch.get(name)
+            if handler:
+                return await handler(arguments)
             return [TextContent(
                 type="text",
                 text=f"Unknown tool: {name}"
             )]
 
-    def __del__(self):
+    async def _do_execute_query(self, arguments: dict) -> list[TextContent]:
         """
-        Clean up resources, close database connection
+        Handle the execute_query tool
         """
-        if hasattr(self, 'db'):
-            self.db.close()
+        return await self._run_timed("Error executing query",
+                                     lambda: self.db.execute_query(arguments["query"]))
+
+    async def _do_execute_batch(self, arguments: dict) -> list[TextContent]:
+        """
+        Handle the execute_batch tool
+        """
+        return await self._run_timed("Error executing batch",
+                                     lambda: self.db.execute_batch(arguments["queries"], arguments.get("params")))
+
+    async def _run_timed(self, error_prefix: str, func: Callable[[], str]) -> list[TextContent]:
+        """
+        Run a blocking database call off the event loop and render its result or error
+        """
+        start_time = time.time()
+        try:
+            # Arguments are read inside func, so missing ones are reported like any other error
+            result = await asyncio.to_thread(func)
+            execution_time = time.time() - start_time
+            
+            return [TextContent(
+                type="text",
+                text=f"Results (execution time: {execution_time:.2f}s):\n" + result
+            )]
+        except Exception as e:
+            error_message = f"{error_prefix}: {str(e)}"
+            logger.error(error_message)
+            return [TextContent(
+                type="text",
+                text=error_message
+            )]
 
 async def main():
     """
     Main function, starts server and handles requests
     """
+    server = None
     try:
         server = SnowflakeServer()
         initialization_options = server.create_initialization_options()
         logger.info("Starting server")
+
+        # Stop on SIGTERM by cancelling this task, connections are closed in the finally block
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass  # Not supported by the Windows event loop
         
         async with stdio.stdio_server() as (read_stream, write_stream):
             await server.run(
@@ -286,10 +669,14 @@ async def main():
                 write_stream,
                 initialization_options
             )
+    except asyncio.CancelledError:
+        logger.info("Server stopped")
     except Exception as e:
-        logger.critical(f"Server failed: {str(e)}", exc_info=True)
+        logger.critical("Server failed: %s", e, exc_info=True)
         raise
     finally:
+        if server is not None:
+            await server.db.aclose()
         logger.info("Server shutting down")
 
 if __name__ == "__main__":
@@ -0,0 +1,133 @@
+import os
+import sys
+import threading
+
+import pytest
+import snowflake.connector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeCursor:
+    """
+    Minimal stand-in for SnowflakeCursor, answers statements from FakeSnowflake
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.arraysize = 1
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_closed(self):
+        return self._closed or self.connection.is_closed()
+
+    def close(self):
+        self._closed = True
+
+    def execute(self, sql, **kwargs):
+        result = self.connection.backend.run(sql)
+        if isinstance(result, int):
+            self.description = None
+            self.rowcount = result
+            self._rows = []
+        else:
+            columns, rows = result
+            self.description = [(name,) for name in columns]
+            self.rowcount = len(rows)
+            self._rows = list(rows)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        for params in seq_of_params:
+            self.execute(sql % tuple(params))
+
+    def nextset(self):
+        return None
+
+    def fetch_arrow_batches(self):
+        raise snowflake.connector.errors.NotSupportedError("no arrow in tests")
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+
+class FakeConnection:
+    """
+    Minimal stand-in for SnowflakeConnection
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    def commit(self):
+        self.backend.run("COMMIT")
+
+    def rollback(self):
+        self.backend.run("ROLLBACK")
+
+
+class FakeSnowflake:
+    """
+    Records executed statements and answers them through an optional handler
+
+    The handler receives the SQL text and returns either (columns, rows) for a
+    result set or an int row count, and may raise to simulate failures.
+    """
+    def __init__(self):
+        self.executed = []
+        self.connections = []
+        self.handler = None
+        self._lock = threading.Lock()
+
+    def connect(self, **kwargs):
+        conn = FakeConnection(self)
+        with self._lock:
+            self.connections.append(conn)
+        return conn
+
+    def run(self, sql):
+        with self._lock:
+            self.executed.append(sql)
+        if self.handler is not None:
+            return self.handler(sql)
+        return ["A"], [(1,)]
+
+    def count(self, sql):
+        with self._lock:
+            return self.executed.count(sql)
+
+
+@pytest.fixture
+def fake_snowflake(monkeypatch):
+    for key in ("USER", "PASSWORD", "ACCOUNT", "DATABASE", "SCHEMA", "ROLE"):
+        monkeypatch.setenv(f"SNOWFLAKE_{key}", "test")
+    monkeypatch.setenv("SNOWFLAKE_WAREHOUSE", "WH")
+    fake = FakeSnowflake()
+    monkeypatch.setattr(snowflake.connector, "connect", fake.connect)
+    return fake
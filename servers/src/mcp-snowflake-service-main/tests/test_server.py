@@ -0,0 +1,450 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+import snowflake.connector
+
+import server
+
+QUERY = "SELECT v FROM t"
+
+
+def _call(results, name, func, *args):
+    """
+    Store the return value or exception of func under name
+    """
+    try:
+        results[name] = func(*args)
+    except Exception as e:
+        results[name] = e
+
+
+def _watch_futures(monkeypatch) -> threading.Event:
+    """
+    Make the server's futures signal when a caller starts waiting on one
+    """
+    waiting = threading.Event()
+
+    class WatchedFuture(Future):
+        def result(self, timeout=None):
+            waiting.set()
+            return super().result(timeout)
+
+    monkeypatch.setattr(server, "Future", WatchedFuture)
+    return waiting
+
+
+def test_query_verb_skips_leading_comments():
+    assert server._query_verb("  select 1") == "SELECT"
+    assert server._query_verb("/* audit */ -- note\n insert into t values (1)") == "INSERT"
+    assert server._query_verb("// note\n;CALL load_proc()") == "CALL"
+    assert server._query_verb("-- only a comment") == ""
+
+
+@pytest.mark.parametrize("query", ["", "  ;\n", "-- nothing here", "/* multi\nline */ ; // c++ style"])
+def test_empty_queries(query):
+    assert server._is_empty_query(query)
+
+
+@pytest.mark.parametrize("query", ["SELECT 1", "-- comment\nSELECT 1", "/* a */ b"])
+def test_non_empty_queries(query):
+    assert not server._is_empty_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM t",
+    "with x as (select 1) select * from x",
+    "SHOW TABLES",
+    "DESC TABLE t",
+    "describe table t",
+    "EXPLAIN SELECT 1",
+])
+def test_read_statements(query):
+    assert server._query_verb(query) in server._READ_VERBS
+
+
+@pytest.mark.parametrize("query", [
+    "CALL load_proc()",
+    "COPY INTO t FROM @stage",
+    "USE SCHEMA other",
+    "GRANT SELECT ON t TO ROLE r",
+    "BEGIN",
+    "/* audit */ INSERT INTO t VALUES (2)",
+])
+def test_other_statements_are_not_reads(query):
+    assert server._query_verb(query) not in server._READ_VERBS
+
+
+@pytest.mark.parametrize("query", [
+    "USE SCHEMA other",
+    "use warehouse wh",
+    "-- switch\nALTER SESSION SET TIMEZONE = 'UTC'",
+    "SET x = 1",
+    "BEGIN",
+    "START TRANSACTION",
+    "COMMIT",
+    "create or replace temporary table t (a int)",
+    "CREATE TEMP TABLE t (a int)",
+])
+def test_session_statements(query):
+    assert server._is_session_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM t",
+    "CREATE TABLE t (a int)",
+    "ALTER TABLE t ADD COLUMN b int",
+    "UPDATE t SET v = 1",
+])
+def test_statements_without_session_effects(query):
+    assert not server._is_session_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM t WHERE ts > CURRENT_TIMESTAMP - INTERVAL '1 hour'",
+    "select random() from t",
+    "SELECT * FROM t WHERE d = current_date",
+    "SELECT LOCALTIME",
+    "SELECT GETDATE()",
+    "select systimestamp ()",
+    "SELECT UUID_STRING()",
+    "SELECT seq4() FROM TABLE(GENERATOR(ROWCOUNT => 10))",
+    "SELECT my_seq.nextval",
+    "SELECT CURRENT_SCHEMA()",
+    "SELECT * FROM t WHERE owner = CURRENT_USER",
+    "SELECT current_warehouse(), current_role()",
+])
+def test_volatile_queries(query):
+    assert server._VOLATILE_RE.search(query)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM t",
+    "SELECT random_value FROM t",
+    "SELECT current_date_col FROM t",
+    "SELECT seq FROM t",
+    "SELECT nextval FROM t",
+])
+def test_stable_queries(query):
+    assert not server._VOLATILE_RE.search(query)
+
+
+def test_empty_query_is_not_sent(fake_snowflake):
+    db = server.SnowflakeConnection()
+
+    assert db.execute_query("-- todo\n;") == "warning\r\nempty query\r\n"
+    assert fake_snowflake.executed == []
+    assert fake_snowflake.connections == []
+
+
+def test_connecting_runs_no_setup_statements(fake_snowflake):
+    db = server.SnowflakeConnection()
+    db.execute_query(QUERY)
+
+    assert fake_snowflake.executed == [QUERY]
+
+
+def test_results_are_rendered_as_csv(fake_snowflake):
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: (["ID", "NAME"], [(1, "a,b"), (2, None)])
+
+    assert db.execute_query(QUERY) == 'ID,NAME\r\n1,"a,b"\r\n2,\r\n'
+
+
+def test_write_reports_affected_rows(fake_snowflake):
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: 3
+
+    assert db.execute_query("DELETE FROM t") == "affected_rows\r\n3\r\n"
+    # Committed by autocommit, without an explicit transaction
+    assert fake_snowflake.executed == ["DELETE FROM t"]
+
+
+def test_rows_over_the_limit_are_truncated(fake_snowflake, monkeypatch):
+    monkeypatch.setenv("MCP_SF_MAX_ROWS", "2")
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: (["A"], [(i,) for i in range(5)])
+
+    result = db.execute_query(QUERY)
+    assert result == "A\r\n0\r\n1\r\n-- truncated: 2 of ~5 rows --\r\n"
+
+    # Truncated results are not cached
+    db.execute_query(QUERY)
+    assert fake_snowflake.count(QUERY) == 2
+
+
+def test_result_at_the_row_limit_is_complete(fake_snowflake, monkeypatch):
+    monkeypatch.setenv("MCP_SF_MAX_ROWS", "2")
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: (["A"], [(0,), (1,)])
+
+    assert db.execute_query(QUERY) == "A\r\n0\r\n1\r\n"
+
+
+def test_rows_over_the_char_limit_are_truncated(fake_snowflake, monkeypatch):
+    monkeypatch.setenv("MCP_SF_MAX_CHARS", "20")
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: (["A"], [("x" * 8,) for _ in range(5)])
+
+    result = db.execute_query(QUERY)
+    assert result.endswith("-- truncated: 2 of ~5 rows --\r\n")
+
+
+class _ArrowColumn:
+    def __init__(self, values):
+        self.values = values
+
+    def to_pylist(self):
+        return list(self.values)
+
+
+class _ArrowBatch:
+    """
+    Minimal stand-in for pyarrow.RecordBatch
+    """
+    def __init__(self, columns):
+        self.columns = [_ArrowColumn(values) for values in columns]
+        self.num_rows = len(columns[0])
+
+    def slice(self, offset, length):
+        return _ArrowBatch([column.values[offset:offset + length] for column in self.columns])
+
+
+def test_arrow_batches_are_sliced_to_the_row_budget(fake_snowflake):
+    db = server.SnowflakeConnection()
+    batches = [_ArrowBatch([[1, 2, 3], ["a", "b", "c"]]), _ArrowBatch([[4, 5, 6], ["d", "e", "f"]]),
+               _ArrowBatch([[7], ["g"]])]
+
+    class ArrowCursor:
+        def fetch_arrow_batches(self):
+            return iter(batches)
+
+    assert list(db._iter_row_batches(ArrowCursor(), 4)) == [[(1, "a"), (2, "b"), (3, "c")], [(4, "d")]]
+
+
+def test_repeated_read_is_served_from_cache(fake_snowflake):
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: (["V"], [("old",)])
+
+    assert db.execute_query(QUERY) == db.execute_query(QUERY)
+    assert fake_snowflake.count(QUERY) == 1
+
+
+def test_failed_write_clears_cache(fake_snowflake):
+    db = server.SnowflakeConnection()
+    state = {"v": "old"}
+
+    def handler(sql):
+        if sql.startswith("UPDATE"):
+            # Committed, but the response was lost
+            state["v"] = "new"
+            raise snowflake.connector.errors.OperationalError("Failed to get the response")
+        return ["V"], [(state["v"],)]
+
+    fake_snowflake.handler = handler
+    assert "old" in db.execute_query(QUERY)
+    with pytest.raises(snowflake.connector.errors.OperationalError):
+        db.execute_query("UPDATE t SET v = 'new'")
+
+    assert "new" in db.execute_query(QUERY)
+    # Writes are never retried
+    assert fake_snowflake.count("UPDATE t SET v = 'new'") == 1
+
+
+def test_session_statements_are_rejected(fake_snowflake):
+    db = server.SnowflakeConnection()
+
+    with pytest.raises(ValueError):
+        db.execute_query("USE SCHEMA other")
+    assert fake_snowflake.executed == []
+
+
+def test_read_overlapping_a_write_is_not_cached(fake_snowflake):
+    db = server.SnowflakeConnection()
+    state = {"v": "old"}
+    started, release = threading.Event(), threading.Event()
+
+    def handler(sql):
+        if sql.startswith("UPDATE"):
+            state["v"] = "new"
+            return 1
+        value = state["v"]
+        if not started.is_set():
+            # Hold the first read until the write has finished on another connection
+            started.set()
+            assert release.wait(5)
+        return ["V"], [(value,)]
+
+    fake_snowflake.handler = handler
+    results = {}
+    reader = threading.Thread(target=_call, args=(results, "read", db.execute_query, QUERY))
+    reader.start()
+    assert started.wait(5)
+    db.execute_query("UPDATE t SET v = 'new'")
+    release.set()
+    reader.join(5)
+
+    assert "old" in results["read"]
+    assert "new" in db.execute_query(QUERY)
+    assert fake_snowflake.count(QUERY) == 2
+
+
+def test_concurrent_identical_reads_execute_once(fake_snowflake, monkeypatch):
+    waiting = _watch_futures(monkeypatch)
+    db = server.SnowflakeConnection()
+    started, release = threading.Event(), threading.Event()
+
+    def handler(sql):
+        started.set()
+        assert release.wait(5)
+        return ["V"], [(42,)]
+
+    fake_snowflake.handler = handler
+    results = {}
+    leader = threading.Thread(target=_call, args=(results, "leader", db.execute_query, QUERY))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=_call, args=(results, "follower", db.execute_query, QUERY))
+    follower.start()
+    assert waiting.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert "42" in results["leader"]
+    assert results["follower"] == results["leader"]
+    assert fake_snowflake.count(QUERY) == 1
+
+
+def test_coalesced_reads_share_the_error(fake_snowflake, monkeypatch):
+    waiting = _watch_futures(monkeypatch)
+    db = server.SnowflakeConnection()
+    started, release = threading.Event(), threading.Event()
+
+    def handler(sql):
+        started.set()
+        assert release.wait(5)
+        raise snowflake.connector.errors.ProgrammingError("boom")
+
+    fake_snowflake.handler = handler
+    results = {}
+    leader = threading.Thread(target=_call, args=(results, "leader", db.execute_query, QUERY))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=_call, args=(results, "follower", db.execute_query, QUERY))
+    follower.start()
+    assert waiting.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert isinstance(results["leader"], snowflake.connector.errors.ProgrammingError)
+    assert results["follower"] is results["leader"]
+    assert fake_snowflake.count(QUERY) == 1
+
+    # The failed query is not remembered, the next caller runs it again
+    fake_snowflake.handler = lambda sql: (["V"], [(1,)])
+    db.execute_query(QUERY)
+    assert fake_snowflake.count(QUERY) == 2
+
+
+def test_batch_runs_in_one_request(fake_snowflake):
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: 1
+
+    result = db.execute_batch(["INSERT INTO t VALUES (1) -- first row", "DELETE FROM t WHERE a = 2;"])
+
+    # Separators on their own line are not swallowed by a trailing comment
+    assert fake_snowflake.executed == [
+        "BEGIN\n;\nINSERT INTO t VALUES (1) -- first row\n;\nDELETE FROM t WHERE a = 2\n;\nCOMMIT"
+    ]
+    assert result == "statement,affected_rows\r\n1,1\r\n2,1\r\n"
+
+
+@pytest.mark.parametrize("queries, params", [
+    ([], None),
+    ("SELECT 1", None),
+    (["SELECT 1", "  "], None),
+    (["SELECT 1", "-- comment only"], None),
+    (["SELECT 1", None], None),
+    (["INSERT INTO t VALUES (%s)", "SELECT 1"], [[1]]),
+    (["INSERT INTO t VALUES (%s)"], [1, 2]),
+])
+def test_invalid_batches_are_rejected(fake_snowflake, queries, params):
+    db = server.SnowflakeConnection()
+
+    with pytest.raises(ValueError):
+        db.execute_batch(queries, params)
+    assert fake_snowflake.executed == []
+
+
+def test_executemany_runs_in_a_transaction(fake_snowflake):
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: 1
+
+    db.execute_batch(["INSERT INTO t VALUES (%s)"], [[1], [2]])
+
+    assert fake_snowflake.executed == ["BEGIN", "INSERT INTO t VALUES (1)", "INSERT INTO t VALUES (2)", "COMMIT"]
+
+
+def test_failed_batch_rolls_back_and_clears_cache(fake_snowflake):
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: (["V"], [("old",)])
+    db.execute_query(QUERY)
+
+    def handler(sql):
+        if sql.startswith("BEGIN"):
+            raise snowflake.connector.errors.ProgrammingError("boom")
+        return ["V"], [("new",)]
+
+    fake_snowflake.handler = handler
+    with pytest.raises(snowflake.connector.errors.ProgrammingError):
+        db.execute_batch(["UPDATE t SET v = 'new'"])
+
+    assert fake_snowflake.count("ROLLBACK") == 1
+    assert "new" in db.execute_query(QUERY)
+
+
+def test_batch_changing_session_state_is_not_pooled(fake_snowflake):
+    db = server.SnowflakeConnection()
+    fake_snowflake.handler = lambda sql: 0
+
+    db.execute_batch(["USE SCHEMA other", "CREATE TABLE t (a int)"])
+    assert fake_snowflake.connections[0].is_closed()
+
+    fake_snowflake.handler = None
+    db.execute_query(QUERY)
+    assert len(fake_snowflake.connections) == 2
+
+
+def test_close_closes_connections_in_use(fake_snowflake, monkeypatch):
+    monkeypatch.setenv("MCP_SF_POOL_SIZE", "1")
+    db = server.SnowflakeConnection()
+    started, release = threading.Event(), threading.Event()
+
+    def handler(sql):
+        if sql == QUERY:
+            started.set()
+            assert release.wait(5)
+        return ["V"], [(1,)]
+
+    fake_snowflake.handler = handler
+    results = {}
+    running = threading.Thread(target=_call, args=(results, "running", db.execute_query, QUERY))
+    running.start()
+    assert started.wait(5)
+    # Waits for the only pooled connection, before or after close() runs
+    waiting = threading.Thread(target=_call, args=(results, "waiting", db.execute_query, "SELECT 2"))
+    waiting.start()
+
+    db.close()
+    assert fake_snowflake.connections[0].is_closed()
+    waiting.join(5)
+    assert isinstance(results["waiting"], RuntimeError)
+
+    release.set()
+    running.join(5)
+    # The returned connection is not handed out again and no new one is opened
+    with pytest.raises(RuntimeError):
+        db.execute_query("SELECT 3")
+    assert len(fake_snowflake.connections) == 1